@@ -1,13 +1,29 @@
+import hashlib
+import io
+import json
 import logging
 import os
+import threading
 import yaml
 import re
+from collections import OrderedDict
 from pathlib import Path
 from dotenv import load_dotenv
 
 # 加载 .env 文件
 load_dotenv()
 
+# 优先使用 libyaml 的 C 实现解析 YAML，未安装时回退到纯 Python 实现
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+
+def load_yaml(stream):
+    """安全解析 YAML（等价于 yaml.safe_load，可用时使用 C 加速）"""
+    return yaml.load(stream, Loader=YamlLoader)
+
 
 def substitute_env_vars(config_dict):
     """
@@ -35,6 +51,130 @@ def substitute_env_vars(config_dict):
 
 logger = logging.getLogger(__name__)
 
+# 文件解析结果缓存：绝对路径 -> (mtime_ns, size, 内容摘要, 解析结果)，LRU 淘汰
+_FILE_CACHE_MAX = 100
+_file_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_file_cache_lock = threading.Lock()
+
+
+def load_cached_file(path, parser):
+    """
+    读取并解析文件，缓存解析结果
+
+    mtime 和 size 都未变化时直接返回缓存；否则读取文件计算 blake2b 摘要，
+    内容未变（例如仅被 touch 或原样保存）时仍复用缓存，只有内容变化才重新解析。
+    缓存按路径区分，同一文件应始终使用同一种解析方式；调用方不应修改返回值。
+
+    Args:
+        path: 文件路径
+        parser: 解析函数，接收已打开的文本文件对象
+
+    Returns:
+        parser 的返回值
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+
+    with _file_cache_lock:
+        entry = _file_cache.get(key)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            _file_cache.move_to_end(key)
+            return entry[3]
+
+    with open(key, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.blake2b(raw, digest_size=16).digest()
+
+    if entry is not None and entry[2] == digest:
+        data = entry[3]
+    else:
+        with io.TextIOWrapper(io.BytesIO(raw), encoding='utf-8') as f:
+            data = parser(f)
+
+    with _file_cache_lock:
+        _file_cache[key] = (st.st_mtime_ns, st.st_size, digest, data)
+        _file_cache.move_to_end(key)
+        if len(_file_cache) > _FILE_CACHE_MAX:
+            _file_cache.popitem(last=False)
+
+    return data
+
+
+# YAML 的 JSON 旁路缓存（需设置 REDBOOK_YAML_CACHE=1 开启），格式变化时递增版本号
+_YAML_JSON_CACHE_VERSION = 1
+
+
+def _yaml_json_cache_enabled() -> bool:
+    return os.getenv('REDBOOK_YAML_CACHE') == '1'
+
+
+def load_yaml_with_json_cache(path: Path, stream):
+    """
+    解析 YAML 文件，并在旁边写入 <文件名>.cache.json
+
+    下次启动时若 JSON 缓存记录的 YAML mtime/size 与当前一致，直接用 json 读取，
+    跳过 YAML 解析。未开启 REDBOOK_YAML_CACHE 时等价于 load_yaml(stream)。
+
+    Args:
+        path: YAML 文件路径
+        stream: 已打开的 YAML 文本文件对象
+    """
+    if not _yaml_json_cache_enabled():
+        return load_yaml(stream)
+
+    cache_path = path.with_name(path.name + '.cache.json')
+    st = path.stat()
+    stamp = [st.st_mtime_ns, st.st_size]
+
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('version') == _YAML_JSON_CACHE_VERSION and cached.get('source') == stamp:
+            logger.debug("使用 JSON 缓存: %s", cache_path)
+            return cached.get('data')
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    data = load_yaml(stream)
+
+    # 只缓存能经 JSON 原样还原的数据（例如非字符串的键、日期等会在 JSON 中变形或无法序列化）
+    try:
+        dumped = json.dumps(data, ensure_ascii=False)
+        transparent = json.loads(dumped) == data
+    except (TypeError, ValueError):
+        transparent = False
+
+    if not transparent:
+        logger.debug("YAML 内容无法无损转为 JSON，跳过 JSON 缓存: %s", path)
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return data
+
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('{"version": %d, "source": %s, "data": %s}' % (
+                _YAML_JSON_CACHE_VERSION, json.dumps(stamp), dumped
+            ))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        # 缓存写入失败不影响正常加载
+        logger.debug("写入 JSON 缓存失败: %s", e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    return data
+
+
+def clear_file_cache():
+    """清空文件解析缓存"""
+    with _file_cache_lock:
+        _file_cache.clear()
+
 
 class Config:
     DEBUG = True
@@ -64,7 +204,7 @@ class Config:
 
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
-                cls._image_providers_config = yaml.safe_load(f) or {}
+                cls._image_providers_config = load_yaml(f) or {}
             # 替换环境变量
             cls._image_providers_config = substitute_env_vars(cls._image_providers_config)
             logger.debug(f"图片配置加载成功: {list(cls._image_providers_config.get('providers', {}).keys())}")
@@ -83,12 +223,14 @@ class Config:
 
     @classmethod
     def load_text_providers_config(cls):
-        """加载文本生成服务商配置"""
-        if cls._text_providers_config is not None:
-            return cls._text_providers_config
+        """
+        加载文本生成服务商配置
 
+        YAML 解析结果按文件 mtime + size 缓存，文件被修改后自动重新解析；
+        每次返回的都是替换环境变量后的新字典，调用方可以放心修改。
+        """
         config_path = Path(__file__).parent.parent / 'text_providers.yaml'
-        logger.debug(f"加载文本服务商配置: {config_path}")
+        logger.debug("加载文本服务商配置: %s", config_path)
 
         if not config_path.exists():
             logger.warning(f"文本配置文件不存在: {config_path}，使用默认配置")
@@ -99,11 +241,13 @@ class Config:
             return cls._text_providers_config
 
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                cls._text_providers_config = yaml.safe_load(f) or {}
-            # 替换环境变量
-            cls._text_providers_config = substitute_env_vars(cls._text_providers_config)
-            logger.debug(f"文本配置加载成功: {list(cls._text_providers_config.get('providers', {}).keys())}")
+            raw_config = load_cached_file(
+                config_path, lambda f: load_yaml_with_json_cache(config_path, f)
+            ) or {}
+            # 替换环境变量（同时生成新的字典，避免调用方修改缓存）
+            cls._text_providers_config = substitute_env_vars(raw_config)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("文本配置加载成功: %s", list(cls._text_providers_config.get('providers', {}).keys()))
         except yaml.YAMLError as e:
             logger.error(f"文本配置文件 YAML 格式错误: {e}")
             raise ValueError(
@@ -186,3 +330,4 @@ class Config:
         logger.info("重新加载所有配置...")
         cls._image_providers_config = None
         cls._text_providers_config = None
+        clear_file_cache()
@@ -243,6 +243,18 @@ def _clear_config_cache():
     except Exception:
         pass
 
+    try:
+        from backend.services.outline import reset_outline_service
+        reset_outline_service()
+    except Exception:
+        pass
+
+    try:
+        from backend.utils.text_client import reset_text_chat_clients
+        reset_text_chat_clients()
+    except Exception:
+        pass
+
 
 def _load_provider_config(provider_type: str, provider_name: str, config: dict) -> dict:
     """
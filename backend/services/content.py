@@ -11,6 +11,7 @@ import re
 import yaml
 from pathlib import Path
 from typing import Dict, List, Any, Optional
+from backend.config import load_yaml
 from backend.utils.text_client import get_text_chat_client
 
 logger = logging.getLogger(__name__)
@@ -34,7 +35,7 @@ class ContentService:
         if config_path.exists():
             try:
                 with open(config_path, 'r', encoding='utf-8') as f:
-                    config = yaml.safe_load(f) or {}
+                    config = load_yaml(f) or {}
                 logger.debug(f"文本配置加载成功: active={config.get('active_provider')}")
                 return config
             except yaml.YAMLError as e:
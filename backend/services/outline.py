@@ -1,13 +1,69 @@
 import logging
 import os
 import re
-import base64
+import threading
+from functools import lru_cache
 from typing import Dict, List, Any, Optional
-from backend.config import Config
+from backend.config import Config, load_cached_file
 from backend.utils.text_client import get_text_chat_client
 
 logger = logging.getLogger(__name__)
 
+# 大纲解析用的正则和页面类型映射
+PAGE_SPLIT_PATTERN = re.compile(r'<page>', re.IGNORECASE)
+PAGE_TYPE_PATTERN = re.compile(r"\[(\S+)\]")
+PAGE_TYPE_MAPPING = {
+    "封面": "cover",
+    "内容": "content",
+    "总结": "summary",
+}
+
+# 大纲生成失败时的错误提示：按顺序匹配（关键字需为小写），命中第一条即使用
+ERROR_HINT_RULES = [
+    (("api_key", "unauthorized", "401"), (
+        "API 认证失败。\n"
+        "错误详情: {error}\n"
+        "可能原因：\n"
+        "1. API Key 无效或已过期\n"
+        "2. API Key 没有访问该模型的权限\n"
+        "解决方案：在系统设置页面检查并更新 API Key"
+    )),
+    (("model", "404"), (
+        "模型访问失败。\n"
+        "错误详情: {error}\n"
+        "可能原因：\n"
+        "1. 模型名称不正确\n"
+        "2. 没有访问该模型的权限\n"
+        "解决方案：在系统设置页面检查模型名称配置"
+    )),
+    (("timeout", "连接"), (
+        "网络连接失败。\n"
+        "错误详情: {error}\n"
+        "可能原因：\n"
+        "1. 网络连接不稳定\n"
+        "2. API 服务暂时不可用\n"
+        "3. Base URL 配置错误\n"
+        "解决方案：检查网络连接，稍后重试"
+    )),
+    (("rate", "429", "quota"), (
+        "API 配额限制。\n"
+        "错误详情: {error}\n"
+        "可能原因：\n"
+        "1. API 调用次数超限\n"
+        "2. 账户配额用尽\n"
+        "解决方案：等待配额重置，或升级 API 套餐"
+    )),
+]
+DEFAULT_ERROR_HINT = (
+    "大纲生成失败。\n"
+    "错误详情: {error}\n"
+    "可能原因：\n"
+    "1. Text API 配置错误或密钥无效\n"
+    "2. 网络连接问题\n"
+    "3. 模型无法访问或不存在\n"
+    "建议：检查配置文件 text_providers.yaml"
+)
+
 
 class OutlineService:
     def __init__(self):
@@ -43,45 +99,26 @@ class OutlineService:
                 "解决方案：请检查系统设置中的文本生成服务商配置是否正确"
             )
 
+        # 按是否需要图片支持缓存客户端，避免每次生成都重新选择服务商
+        self._client_cache: Dict[bool, Any] = {}
         self.client = self._get_client()
         self.prompt_template = self._load_prompt_template()
-        logger.info(f"OutlineService 初始化完成，使用服务商: {self.text_config.get('active_provider')}")
-
-    def _load_text_config(self) -> dict:
-        """加载文本生成配置"""
-        config_path = Path(__file__).parent.parent.parent / 'text_providers.yaml'
-        logger.debug(f"加载文本配置: {config_path}")
-
-        if config_path.exists():
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = yaml.safe_load(f) or {}
-                logger.debug(f"文本配置加载成功: active={config.get('active_provider')}")
-                return config
-            except yaml.YAMLError as e:
-                logger.error(f"文本配置 YAML 解析失败: {e}")
-                raise ValueError(
-                    f"文本配置文件格式错误: text_providers.yaml\n"
-                    f"YAML 解析错误: {e}\n"
-                    "解决方案：检查 YAML 缩进和语法"
-                )
-
-        logger.warning("text_providers.yaml 不存在，使用默认配置")
-        # 默认配置
-        return {
-            'active_provider': 'google_gemini',
-            'providers': {
-                'google_gemini': {
-                    'type': 'google_gemini',
-                    'model': 'gemini-2.0-flash-exp',
-                    'temperature': 1.0,
-                    'max_output_tokens': 8000
-                }
-            }
-        }
+        logger.info("OutlineService 初始化完成，使用服务商: %s", self.text_config.get('active_provider'))
 
     def _get_client(self, needs_image_support: bool = False):
-        """根据配置获取客户端
+        """获取客户端（按是否需要图片支持缓存）
+
+        Args:
+            needs_image_support: 是否需要图片支持
+        """
+        client = self._client_cache.get(needs_image_support)
+        if client is None:
+            client = self._build_client(needs_image_support)
+            self._client_cache[needs_image_support] = client
+        return client
+
+    def _build_client(self, needs_image_support: bool = False):
+        """根据配置创建客户端
         
         Args:
             needs_image_support: 是否需要图片支持
@@ -98,37 +135,28 @@ class OutlineService:
                 "2. 或手动编辑 text_providers.yaml 文件"
             )
 
-        # 如果需要图片支持，优先选择支持图片的模型
+        # 如果需要图片支持，优先选择支持图片的模型（默认假设支持图片）
+        selected_provider = provider_config = None
         if needs_image_support:
-            # 查找支持图片的模型
-            image_supported_providers = []
-            for name, config in providers.items():
-                if config.get('supports_images', True):  # 默认假设支持图片
-                    image_supported_providers.append((name, config))
-            
-            if image_supported_providers:
-                # 优先使用当前激活的模型（如果支持图片）
-                if active_provider in [p[0] for p in image_supported_providers]:
-                    selected_provider = active_provider
-                    provider_config = providers[active_provider]
-                else:
-                    # 选择第一个支持图片的模型
-                    selected_provider, provider_config = image_supported_providers[0]
-                logger.info(f"需要图片支持，选择服务商: {selected_provider} (支持图片)")
+            # 优先使用当前激活的模型（如果支持图片）
+            active_config = providers.get(active_provider)
+            if active_config is not None and active_config.get('supports_images', True):
+                selected_provider, provider_config = active_provider, active_config
+            else:
+                # 选择第一个支持图片的模型
+                for name, config in providers.items():
+                    if config.get('supports_images', True):
+                        selected_provider, provider_config = name, config
+                        break
+
+            if provider_config is not None:
+                logger.info("需要图片支持，选择服务商: %s (支持图片)", selected_provider)
             else:
                 # 没有支持图片的模型，使用默认
                 logger.warning("没有找到支持图片的文本服务商，使用默认服务商")
-                if active_provider not in providers:
-                    available = ', '.join(providers.keys())
-                    raise ValueError(
-                        f"未找到文本生成服务商配置: {active_provider}\n"
-                        f"可用的服务商: {available}\n"
-                        "解决方案：在系统设置中选择一个可用的服务商"
-                    )
-                selected_provider = active_provider
-                provider_config = providers[active_provider]
-        else:
-            # 不需要图片支持，使用当前激活的模型
+
+        if provider_config is None:
+            # 不需要图片支持（或没有支持图片的模型），使用当前激活的模型
             if active_provider not in providers:
                 available = ', '.join(providers.keys())
                 logger.error(f"文本服务商 [{active_provider}] 不存在，可用: {available}")
@@ -147,7 +175,10 @@ class OutlineService:
                 "解决方案：在系统设置页面编辑该服务商，填写 API Key"
             )
 
-        logger.info(f"使用文本服务商: {selected_provider} (type={provider_config.get('type')}, 支持图片={provider_config.get('supports_images', True)})")
+        logger.info(
+            "使用文本服务商: %s (type=%s, 支持图片=%s)",
+            selected_provider, provider_config.get('type'), provider_config.get('supports_images', True)
+        )
         return get_text_chat_client(provider_config)
 
     def _load_prompt_template(self) -> str:
@@ -156,13 +187,18 @@ class OutlineService:
             "prompts",
             "outline_prompt.txt"
         )
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            return f.read()
+        return load_cached_file(prompt_path, lambda f: f.read())
+
+    def _render_prompt(self, topic: str) -> str:
+        # 每次渲染都经过文件缓存取模板，outline_prompt.txt 修改后无需重启即可生效
+        template = self._load_prompt_template()
+        self.prompt_template = template
+        return _render_prompt_template(template, topic)
 
     def _parse_outline(self, outline_text: str) -> List[Dict[str, Any]]:
         # 按 <page> 分割页面（兼容旧的 --- 分隔符）
         if '<page>' in outline_text:
-            pages_raw = re.split(r'<page>', outline_text, flags=re.IGNORECASE)
+            pages_raw = PAGE_SPLIT_PATTERN.split(outline_text)
         else:
             # 向后兼容：如果没有 <page> 则使用 ---
             pages_raw = outline_text.split("---")
@@ -175,15 +211,9 @@ class OutlineService:
                 continue
 
             page_type = "content"
-            type_match = re.match(r"\[(\S+)\]", page_text)
+            type_match = PAGE_TYPE_PATTERN.match(page_text)
             if type_match:
-                type_cn = type_match.group(1)
-                type_mapping = {
-                    "封面": "cover",
-                    "内容": "content",
-                    "总结": "summary",
-                }
-                page_type = type_mapping.get(type_cn, "content")
+                page_type = PAGE_TYPE_MAPPING.get(type_match.group(1), "content")
 
             pages.append({
                 "index": index,
@@ -199,30 +229,24 @@ class OutlineService:
         images: Optional[List[bytes]] = None
     ) -> Dict[str, Any]:
         try:
-            logger.info(f"开始生成大纲: topic={topic[:50]}..., images={len(images) if images else 0}")
+            logger.info("开始生成大纲: topic=%.50s..., images=%d", topic, len(images) if images else 0)
             
             # 根据是否需要图片支持获取客户端
             needs_image_support = images is not None and len(images) > 0
             client = self._get_client(needs_image_support=needs_image_support)
             
-            prompt = self.prompt_template.format(topic=topic)
+            prompt = self._render_prompt(topic)
 
-            if images and len(images) > 0:
+            if needs_image_support:
                 prompt += f"\n\n注意：用户提供了 {len(images)} 张参考图片，请在生成大纲时考虑这些图片的内容和风格。这些图片可能是产品图、个人照片或场景图，请根据图片内容来优化大纲，使生成的内容与图片相关联。"
-                logger.debug(f"添加了 {len(images)} 张参考图片到提示词")
+                logger.debug("添加了 %d 张参考图片到提示词", len(images))
 
-            # 从当前客户端配置中获取模型参数
-            # 注意：这里需要从配置中获取当前选择的provider的配置
-            active_provider = self.text_config.get('active_provider', 'google_gemini')
-            providers = self.text_config.get('providers', {})
-            
-            # 由于_get_client可能选择了不同的provider，我们需要重新获取配置
-            # 简化处理：使用默认配置，实际模型参数由客户端内部处理
+            # 使用默认模型参数，实际模型参数由客户端内部处理
             model = "gpt-4o"  # 默认值，实际由客户端决定
             temperature = 1.0
             max_output_tokens = 8000
 
-            logger.info(f"调用文本生成 API: 需要图片支持={needs_image_support}, temperature={temperature}")
+            logger.info("调用文本生成 API: 需要图片支持=%s, temperature=%s", needs_image_support, temperature)
             outline_text = client.generate_text(
                 prompt=prompt,
                 model=model,
@@ -231,15 +255,15 @@ class OutlineService:
                 images=images
             )
 
-            logger.debug(f"API 返回文本长度: {len(outline_text)} 字符")
+            logger.debug("API 返回文本长度: %d 字符", len(outline_text))
             pages = self._parse_outline(outline_text)
-            logger.info(f"大纲解析完成，共 {len(pages)} 页")
+            logger.info("大纲解析完成，共 %d 页", len(pages))
 
             return {
                 "success": True,
                 "outline": outline_text,
                 "pages": pages,
-                "has_images": images is not None and len(images) > 0
+                "has_images": needs_image_support
             }
 
         except Exception as e:
@@ -247,53 +271,13 @@ class OutlineService:
             logger.error(f"大纲生成失败: {error_msg}")
 
             # 根据错误类型提供更详细的错误信息
-            if "api_key" in error_msg.lower() or "unauthorized" in error_msg.lower() or "401" in error_msg:
-                detailed_error = (
-                    f"API 认证失败。\n"
-                    f"错误详情: {error_msg}\n"
-                    "可能原因：\n"
-                    "1. API Key 无效或已过期\n"
-                    "2. API Key 没有访问该模型的权限\n"
-                    "解决方案：在系统设置页面检查并更新 API Key"
-                )
-            elif "model" in error_msg.lower() or "404" in error_msg:
-                detailed_error = (
-                    f"模型访问失败。\n"
-                    f"错误详情: {error_msg}\n"
-                    "可能原因：\n"
-                    "1. 模型名称不正确\n"
-                    "2. 没有访问该模型的权限\n"
-                    "解决方案：在系统设置页面检查模型名称配置"
-                )
-            elif "timeout" in error_msg.lower() or "连接" in error_msg:
-                detailed_error = (
-                    f"网络连接失败。\n"
-                    f"错误详情: {error_msg}\n"
-                    "可能原因：\n"
-                    "1. 网络连接不稳定\n"
-                    "2. API 服务暂时不可用\n"
-                    "3. Base URL 配置错误\n"
-                    "解决方案：检查网络连接，稍后重试"
-                )
-            elif "rate" in error_msg.lower() or "429" in error_msg or "quota" in error_msg.lower():
-                detailed_error = (
-                    f"API 配额限制。\n"
-                    f"错误详情: {error_msg}\n"
-                    "可能原因：\n"
-                    "1. API 调用次数超限\n"
-                    "2. 账户配额用尽\n"
-                    "解决方案：等待配额重置，或升级 API 套餐"
-                )
-            else:
-                detailed_error = (
-                    f"大纲生成失败。\n"
-                    f"错误详情: {error_msg}\n"
-                    "可能原因：\n"
-                    "1. Text API 配置错误或密钥无效\n"
-                    "2. 网络连接问题\n"
-                    "3. 模型无法访问或不存在\n"
-                    "建议：检查配置文件 text_providers.yaml"
-                )
+            error_lower = error_msg.lower()
+            template = next(
+                (tpl for keywords, tpl in ERROR_HINT_RULES
+                 if any(k in error_lower for k in keywords)),
+                DEFAULT_ERROR_HINT
+            )
+            detailed_error = template.format(error=error_msg)
 
             return {
                 "success": False,
@@ -301,9 +285,65 @@ class OutlineService:
             }
 
 
+@lru_cache(maxsize=8)
+def _split_prompt_template(template: str) -> Optional[tuple]:
+    """
+    按 {topic} 预先切分模板，之后渲染只需字符串拼接
+
+    模板中只有一个 {topic} 且没有其他花括号时才切分，否则返回 None，
+    由 str.format 处理转义等情况。
+    """
+    parts = template.split('{topic}')
+    if len(parts) != 2 or any('{' in p or '}' in p for p in parts):
+        return None
+    return parts[0], parts[1]
+
+
+@lru_cache(maxsize=32)
+def _render_prompt_template(template: str, topic: str) -> str:
+    """渲染大纲提示词（缓存最近的结果，重试或重复提交同一主题时直接复用）"""
+    parts = _split_prompt_template(template)
+    if parts is None:
+        return template.format(topic=topic)
+    return parts[0] + topic + parts[1]
+
+
+# 全局服务实例，以及创建时 text_providers.yaml 的修改时间
+_service_instance = None
+_service_config_mtime = None
+_service_lock = threading.Lock()
+
+TEXT_CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "text_providers.yaml"
+)
+
+
+def _get_text_config_mtime() -> Optional[float]:
+    try:
+        return os.stat(TEXT_CONFIG_PATH).st_mtime
+    except OSError:
+        return None
+
+
 def get_outline_service() -> OutlineService:
     """
     获取大纲生成服务实例
-    每次调用都创建新实例以确保配置是最新的
+    复用全局实例，text_providers.yaml 被修改后自动重建以确保配置是最新的
+    （提示词模板在每次生成时经文件缓存读取，修改后同样自动生效）
     """
-    return OutlineService()
+    global _service_instance, _service_config_mtime
+    mtime = _get_text_config_mtime()
+    with _service_lock:
+        if _service_instance is None or mtime != _service_config_mtime:
+            _service_instance = OutlineService()
+            _service_config_mtime = mtime
+        return _service_instance
+
+
+def reset_outline_service():
+    """重置全局服务实例（配置更新后调用）"""
+    global _service_instance, _service_config_mtime
+    with _service_lock:
+        _service_instance = None
+        _service_config_mtime = None
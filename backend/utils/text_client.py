@@ -1,38 +1,253 @@
 """Text API 客户端封装"""
 import time
 import random
+import asyncio
 import base64
+import contextlib
+import contextvars
+import hashlib
+import inspect
+import multiprocessing
+import os
+import threading
 import requests
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from functools import wraps
-from typing import List, Optional, Union
+from requests.adapters import HTTPAdapter
+from typing import List, Optional, Tuple, Union
 from .image_compressor import compress_image
 
+# 优先使用 orjson 序列化/解析 JSON（大体积 base64 图片请求明显更快），未安装时回退到标准库
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    _json_loads = json.loads
+
+# 异步客户端依赖 httpx（HTTP/2 还需要 h2，即 httpx[http2]），未安装时只提供同步接口
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# 已压缩并编码的图片 data URL 缓存：blake2b(原图) -> data URL，LRU 淘汰
+_IMAGE_URL_CACHE_MAX = 64
+_image_url_cache: "OrderedDict[bytes, str]" = OrderedDict()
+_image_url_cache_lock = threading.Lock()
+_DATA_URL_PREFIX = b"data:image/png;base64,"
+
+# 每个客户端缓存的已上传图片 file_id 数量上限（淘汰的 file_id 留待 delete_uploaded_files 删除）
+_FILE_ID_CACHE_MAX = 64
+
+# 请求中带 file_id 引用时，这些状态码视为服务商不接受该引用格式，改用 base64 重新请求
+_FILE_REF_REJECTED_STATUS = (400, 422)
+
+# delete_uploaded_files 单个 DELETE 请求的超时（秒）
+_FILE_DELETE_TIMEOUT = 5.0
+
+# 多张图片时用于并行压缩/编码的进程池（需设置 REDBOOK_IMAGE_POOL=1 开启，首次使用时创建）
+_image_pool: Optional[ProcessPoolExecutor] = None
+_image_pool_lock = threading.Lock()
+
+
+def _encode_data_url(compressed_img: bytes) -> str:
+    """把已压缩的图片转为 base64 data URL"""
+    # 直接在 bytes 上拼接前缀，只在最后解码一次，省去中间的 base64 str
+    buf = bytearray(_DATA_URL_PREFIX)
+    buf += base64.b64encode(compressed_img)
+    return buf.decode('ascii')
+
+
+def _compress(image_data: bytes) -> bytes:
+    """压缩图片到 200KB 以内（可在子进程中执行）"""
+    return compress_image(image_data, max_size_kb=200)
+
+
+def _compress_and_encode(image_data: bytes) -> str:
+    """压缩图片到 200KB 以内并转为 base64 data URL（可在子进程中执行）"""
+    return _encode_data_url(_compress(image_data))
+
+
+def _cache_data_url(key: bytes, image_url: str):
+    """写入 data URL 缓存，超出上限时淘汰最久未使用的"""
+    with _image_url_cache_lock:
+        _image_url_cache[key] = image_url
+        _image_url_cache.move_to_end(key)
+        if len(_image_url_cache) > _IMAGE_URL_CACHE_MAX:
+            _image_url_cache.popitem(last=False)
+
+
+def _fill_file_id(template, file_id: str):
+    """把模板中所有字符串里的 {file_id} 替换为实际的 file_id"""
+    if isinstance(template, dict):
+        return {k: _fill_file_id(v, file_id) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_fill_file_id(v, file_id) for v in template]
+    if isinstance(template, str):
+        return template.replace('{file_id}', file_id)
+    return template
+
+
+def _image_pool_workers() -> int:
+    """进程池的工作进程数：当前进程可用的 CPU 数（考虑 CPU 亲和性限制），最多 4 个"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # macOS / Windows 没有 sched_getaffinity
+        cpus = os.cpu_count() or 1
+    return min(4, cpus)
+
+
+def _image_pool_enabled() -> bool:
+    """显式开启且至少有 2 个可用 CPU 时才使用进程池，单核上进程池只会更慢"""
+    return os.getenv('REDBOOK_IMAGE_POOL') == '1' and _image_pool_workers() >= 2
+
+
+def _get_image_pool() -> ProcessPoolExecutor:
+    # 使用 spawn 而不是 Linux 默认的 fork：Flask 以多线程方式处理请求，
+    # 在其他线程持有锁（如日志、连接池）时 fork 出的子进程可能死锁
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            _image_pool = ProcessPoolExecutor(
+                max_workers=_image_pool_workers(),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _image_pool
+
+
+def _discard_image_pool(pool: ProcessPoolExecutor):
+    """丢弃已损坏的进程池，下次使用时重新创建"""
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is pool:
+            _image_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _process_images(fn, images: List[bytes]) -> list:
+    """
+    对多张图片执行 fn（压缩或压缩并编码），默认逐张处理
+
+    设置 REDBOOK_IMAGE_POOL=1 且可用 CPU 不少于 2 个时，多张图片在进程池中并行处理，
+    进程池不可用时回退为逐张处理。进程池使用 spawn 方式启动子进程，子进程会重新导入
+    主模块：直接运行的脚本必须把调用代码放在 if __name__ == '__main__': 之下，
+    否则子进程启动时报错。
+    """
+    if len(images) > 1 and _image_pool_enabled():
+        pool = None
+        try:
+            pool = _get_image_pool()
+            return list(pool.map(fn, images))
+        except BrokenProcessPool as e:
+            print(f"[图片压缩] 进程池已损坏，改为逐张处理: {e}")
+            _discard_image_pool(pool)
+        except OSError as e:
+            # 无法创建子进程等系统错误
+            print(f"[图片压缩] 进程池不可用，改为逐张处理: {e}")
+    return [fn(img) for img in images]
+
+
+def _compress_and_encode_many(images: List[bytes]) -> List[str]:
+    """批量压缩并编码为 data URL"""
+    return _process_images(_compress_and_encode, images)
+
+
+def _compress_many(images: List[bytes]) -> List[bytes]:
+    """批量压缩图片"""
+    return _process_images(_compress, images)
+
+
+class TextAPIError(Exception):
+    """Text API 返回非 200 状态码"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RateLimitError(TextAPIError):
+    """API 返回 429 限流错误"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, status_code=429)
+        self.retry_after = retry_after
+
+
+# Retry-After 最长等待时间（秒），避免请求线程被长时间阻塞
+_RETRY_AFTER_MAX = 60.0
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return min(max(float(value), 0.0), _RETRY_AFTER_MAX)
+    except ValueError:
+        return None
+
 
 def retry_on_429(max_retries=3, base_delay=2):
-    """429 错误自动重试装饰器"""
+    """429 错误自动重试装饰器（优先遵循 Retry-After 响应头，支持 async 函数）"""
+    def get_wait_time(e: RateLimitError, attempt: int) -> float:
+        wait_time = e.retry_after
+        if wait_time is None:
+            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+        print(f"[重试] 遇到限流，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+        return wait_time
+
+    def exhausted_error() -> Exception:
+        return Exception(
+            f"Text API 重试 {max_retries} 次后仍失败。\n"
+            "可能原因：\n"
+            "1. API持续限流或配额不足\n"
+            "2. 网络连接持续不稳定\n"
+            "3. API服务暂时不可用\n"
+            "建议：稍后再试，或联系API服务提供商"
+        )
+
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except RateLimitError as e:
+                        if attempt < max_retries - 1:
+                            await asyncio.sleep(get_wait_time(e, attempt))
+                            continue
+                        raise
+                raise exhausted_error()
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
-                except Exception as e:
-                    error_str = str(e)
-                    if "429" in error_str or "rate" in error_str.lower():
-                        if attempt < max_retries - 1:
-                            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
-                            print(f"[重试] 遇到限流，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                            time.sleep(wait_time)
-                            continue
+                except RateLimitError as e:
+                    if attempt < max_retries - 1:
+                        time.sleep(get_wait_time(e, attempt))
+                        continue
                     raise
-            raise Exception(
-                f"Text API 重试 {max_retries} 次后仍失败。\n"
-                "可能原因：\n"
-                "1. API持续限流或配额不足\n"
-                "2. 网络连接持续不稳定\n"
-                "3. API服务暂时不可用\n"
-                "建议：稍后再试，或联系API服务提供商"
-            )
+            raise exhausted_error()
         return wrapper
     return decorator
 
@@ -40,7 +255,15 @@ def retry_on_429(max_retries=3, base_delay=2):
 class TextChatClient:
     """Text API 客户端封装类"""
 
-    def __init__(self, api_key: str = None, base_url: str = None, endpoint_type: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        endpoint_type: str = None,
+        supports_file_upload: bool = False,
+        file_upload_endpoint: str = None,
+        file_content_part: dict = None
+    ):
         self.api_key = api_key
         if not self.api_key:
             raise ValueError(
@@ -57,56 +280,279 @@ class TextChatClient:
             endpoint = '/' + endpoint
         self.chat_endpoint = f"{self.base_url}{endpoint}"
 
-    def _encode_image_to_base64(self, image_data: bytes) -> str:
-        """将图片数据编码为 base64"""
-        return base64.b64encode(image_data).decode('utf-8')
+        # 支持文件上传的服务商：图片先上传，再在消息中按 file_id 引用，省去 base64 编码。
+        # 引用格式因服务商而异，由 file_content_part 模板给出（其中的 {file_id} 会被替换）
+        self.file_content_part = file_content_part
+        self.supports_file_upload = supports_file_upload and file_content_part is not None
+        if supports_file_upload and file_content_part is None:
+            print("[图片上传] 未配置 file_content_part，无法引用已上传的文件，改用 base64 发送图片")
+        upload_endpoint = file_upload_endpoint or '/v1/files'
+        if not upload_endpoint.startswith('/'):
+            upload_endpoint = '/' + upload_endpoint
+        self.file_upload_endpoint = f"{self.base_url}{upload_endpoint}"
+        # 已上传图片缓存：blake2b(原图) -> file_id，LRU 淘汰
+        self._file_ids: "OrderedDict[bytes, str]" = OrderedDict()
+        # 已不再引用、等待 delete_uploaded_files 删除的 file_id
+        self._unused_file_ids: List[str] = []
+        self._file_ids_lock = threading.Lock()
+
+        self._headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+        # 复用 HTTP 连接，避免每次请求都重新进行 TCP/TLS 握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.headers.update(self._headers)
+
+        # async_session() 作用域内共享的 httpx.AsyncClient（按上下文隔离，作用域结束即关闭）
+        self._async_http = contextvars.ContextVar(f"text_client_async_http_{id(self)}", default=None)
+
+    def _images_to_data_urls(self, images: List[bytes]) -> List[str]:
+        """
+        压缩图片并转为 base64 data URL
+
+        结果按原图内容哈希缓存，重试或重复提交同一张参考图时不再重复压缩和编码；
+        未命中缓存的图片由 _compress_and_encode_many 处理（开启进程池时并行）
+        """
+        keys = [hashlib.blake2b(img, digest_size=16).digest() for img in images]
+        urls = [None] * len(images)
+        missing = {}  # key -> 原图，重复的图片只处理一次
+
+        with _image_url_cache_lock:
+            for i, key in enumerate(keys):
+                image_url = _image_url_cache.get(key)
+                if image_url is not None:
+                    _image_url_cache.move_to_end(key)
+                    urls[i] = image_url
+                else:
+                    missing.setdefault(key, images[i])
+
+        if missing:
+            encoded = dict(zip(missing, _compress_and_encode_many(list(missing.values()))))
+            for key, image_url in encoded.items():
+                _cache_data_url(key, image_url)
+            for i, key in enumerate(keys):
+                if urls[i] is None:
+                    urls[i] = encoded[key]
+
+        return urls
+
+    def _upload_image(self, compressed_img: bytes) -> Optional[str]:
+        """上传单张已压缩的图片，返回 file_id，失败时返回 None（调用方回退为 base64）"""
+        if compressed_img[:8] == b"\x89PNG\r\n\x1a\n":
+            filename, mime_type = "image.png", "image/png"
+        else:
+            filename, mime_type = "image.jpg", "image/jpeg"
+
+        try:
+            response = self._session.post(
+                self.file_upload_endpoint,
+                files={"file": (filename, compressed_img, mime_type)},
+                data={"purpose": "vision"},
+                # 去掉会话默认的 JSON Content-Type，由 requests 生成 multipart 边界
+                headers={"Content-Type": None},
+                timeout=60
+            )
+            if response.status_code != 200:
+                print(f"[图片上传] 上传失败 (状态码: {response.status_code})，改用 base64: {response.text[:200]}")
+                return None
+            return _json_loads(response.content).get("id")
+        except Exception as e:
+            print(f"[图片上传] 上传失败，改用 base64: {e}")
+            return None
+
+    def _upload_images(self, images: List[bytes]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        上传图片，返回与 images 一一对应的 (file_id, data_url)，两者只有一个不为 None
+
+        file_id 按原图内容哈希缓存，同一张参考图只上传一次。需要上传的图片优先从
+        data URL 缓存中取已压缩的数据，其余批量压缩（开启进程池时并行）；上传失败时
+        直接用已压缩的图片生成 data URL，不再重复压缩
+        """
+        keys = [hashlib.blake2b(img, digest_size=16).digest() for img in images]
+        results = [None] * len(images)
+        missing = {}  # key -> 原图，重复的图片只上传一次
+
+        with self._file_ids_lock:
+            for i, key in enumerate(keys):
+                file_id = self._file_ids.get(key)
+                if file_id is not None:
+                    self._file_ids.move_to_end(key)
+                    results[i] = (file_id, None)
+                else:
+                    missing.setdefault(key, images[i])
+
+        if missing:
+            compressed = {}  # key -> (压缩后的图片, 已缓存的 data URL)
+            with _image_url_cache_lock:
+                for key in missing:
+                    image_url = _image_url_cache.get(key)
+                    if image_url is not None:
+                        _image_url_cache.move_to_end(key)
+                        compressed[key] = (base64.b64decode(image_url[len(_DATA_URL_PREFIX):]), image_url)
+            to_compress = [key for key in missing if key not in compressed]
+            if to_compress:
+                for key, data in zip(to_compress, _compress_many([missing[k] for k in to_compress])):
+                    compressed[key] = (data, None)
+
+            uploaded = {}
+            for key, (data, image_url) in compressed.items():
+                file_id = self._upload_image(data)
+                if file_id is not None:
+                    self._remember_file_id(key, file_id)
+                    uploaded[key] = (file_id, None)
+                    continue
+                if image_url is None:
+                    image_url = _encode_data_url(data)
+                    _cache_data_url(key, image_url)
+                uploaded[key] = (None, image_url)
+
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = uploaded[key]
+
+        return results
+
+    def _remember_file_id(self, key: bytes, file_id: str):
+        """记录已上传的 file_id，超出上限时淘汰最久未使用的（只移出缓存，不发起删除）"""
+        with self._file_ids_lock:
+            self._file_ids[key] = file_id
+            self._file_ids.move_to_end(key)
+            if len(self._file_ids) > _FILE_ID_CACHE_MAX:
+                self._unused_file_ids.append(self._file_ids.popitem(last=False)[1])
+
+    def _forget_file_ids(self, file_ids: List[str]):
+        """丢弃已失效（过期或被删除）的 file_id，之后重新上传对应图片"""
+        stale = set(file_ids)
+        with self._file_ids_lock:
+            for key in [k for k, v in self._file_ids.items() if v in stale]:
+                del self._file_ids[key]
+
+    def _delete_file(self, file_id: str, timeout: float) -> bool:
+        """从服务商处删除已上传的文件，返回是否成功（失败只打印日志）"""
+        try:
+            response = self._session.delete(f"{self.file_upload_endpoint}/{file_id}", timeout=timeout)
+            if response.status_code in (200, 204, 404):
+                return True
+            print(f"[图片上传] 删除文件 {file_id} 失败 (状态码: {response.status_code})")
+        except Exception as e:
+            print(f"[图片上传] 删除文件 {file_id} 失败: {e}")
+        return False
+
+    def delete_uploaded_files(self, time_budget: float = 10.0) -> int:
+        """
+        删除本客户端上传过的文件（包括已从缓存淘汰的），只在显式调用时执行
+
+        应在确定没有请求仍在使用该客户端时调用（例如脚本结束前）。逐个发送 DELETE，
+        总耗时超过 time_budget 秒后停止，未处理的 file_id 留待下次调用。
+
+        Returns:
+            成功删除的文件数
+        """
+        with self._file_ids_lock:
+            file_ids = self._unused_file_ids + list(self._file_ids.values())
+            self._unused_file_ids = []
+            self._file_ids.clear()
+
+        deadline = time.monotonic() + time_budget
+        deleted = 0
+        for i, file_id in enumerate(file_ids):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._file_ids_lock:
+                    self._unused_file_ids.extend(file_ids[i:])
+                print(f"[图片上传] 删除超时，剩余 {len(file_ids) - i} 个文件留待下次删除")
+                break
+            if self._delete_file(file_id, timeout=min(_FILE_DELETE_TIMEOUT, remaining)):
+                deleted += 1
+        return deleted
+
+    def _disable_file_upload(self, status_code: int):
+        """服务商不接受 file_id 引用时关闭文件上传（已上传的文件留待 delete_uploaded_files 删除）"""
+        if self.supports_file_upload:
+            self.supports_file_upload = False
+            print(f"[图片上传] 服务商不接受 file_content_part 格式的引用 (状态码: {status_code})，之后改用 base64 发送图片")
+        with self._file_ids_lock:
+            self._unused_file_ids.extend(self._file_ids.values())
+            self._file_ids.clear()
+
+    def _should_retry_without_files(self, e: TextAPIError, file_ids: List[str]) -> bool:
+        """请求带 file_id 引用且失败时，判断是否改用 base64 重新请求"""
+        if not file_ids:
+            return False
+        if e.status_code == 404:
+            # 文件可能已过期或被删除：丢弃这些 file_id，下次重新上传；
+            # 若确实是模型或端点不存在，base64 重发时会再次返回 404
+            print("[图片上传] 请求返回 404，可能是文件已失效，丢弃这些 file_id 并改用 base64 重新请求")
+            self._forget_file_ids(file_ids)
+            return True
+        if e.status_code in _FILE_REF_REJECTED_STATUS:
+            print(f"[图片上传] 请求被拒绝 (状态码: {e.status_code})，改用 base64 重新请求")
+            return True
+        return False
 
     def _build_content_with_images(
         self,
         text: str,
-        images: List[Union[bytes, str]] = None
-    ) -> Union[str, List[dict]]:
+        images: List[Union[bytes, str]] = None,
+        use_file_upload: bool = False
+    ) -> Tuple[Union[str, List[dict]], List[str]]:
         """
         构建包含图片的 content
 
         Args:
             text: 文本内容
             images: 图片列表，可以是 bytes（图片数据）或 str（URL）
+            use_file_upload: 是否先上传图片再按 file_id 引用
 
         Returns:
-            如果没有图片，返回纯文本；有图片则返回多模态内容列表
+            (content, 引用的 file_id 列表)。没有图片时 content 为纯文本，
+            有图片则为多模态内容列表
         """
         if not images:
-            return text
+            return text, []
 
         # 检查API是否支持图片（DeepSeek API不支持image_url）
         # 如果base_url包含deepseek.com，则不发送图片，而是在文本中说明
         if "deepseek.com" in self.base_url:
             # DeepSeek API不支持图片，将图片信息添加到文本提示中
             image_info = f"\n\n注意：用户上传了 {len(images)} 张参考图片，但由于当前API限制，无法直接发送图片数据。请根据以下描述生成内容：用户提供了视觉参考材料，请生成与视觉内容相关的文本。"
-            return text + image_info
+            return text + image_info, []
 
-        content = [{"type": "text", "text": text}]
+        # 图片数据优先上传后按 file_id 引用（服务商支持时），否则转为 base64 data URL，
+        # 已经是 URL 的直接使用
+        image_bytes = [img for img in images if isinstance(img, bytes)]
+        if image_bytes and use_file_upload:
+            encoded = iter(self._upload_images(image_bytes))
+        elif image_bytes:
+            encoded = iter([(None, url) for url in self._images_to_data_urls(image_bytes)])
+        file_ids = []
 
-        for img in images:
+        content = [None] * (1 + len(images))
+        content[0] = {"type": "text", "text": text}
+
+        for i, img in enumerate(images, 1):
             if isinstance(img, bytes):
-                # 压缩图片到 200KB 以内
-                compressed_img = compress_image(img, max_size_kb=200)
-                # 图片数据，转为 base64 data URL
-                base64_data = self._encode_image_to_base64(compressed_img)
-                image_url = f"data:image/png;base64,{base64_data}"
+                file_id, image_url = next(encoded)
+                if file_id is not None:
+                    content[i] = _fill_file_id(self.file_content_part, file_id)
+                    file_ids.append(file_id)
+                    continue
             else:
-                # 已经是 URL
                 image_url = img
 
-            content.append({
+            content[i] = {
                 "type": "image_url",
                 "image_url": {"url": image_url}
-            })
+            }
 
-        return content
+        return content, file_ids
 
-    @retry_on_429(max_retries=3, base_delay=2)
     def generate_text(
         self,
         prompt: str,
@@ -114,8 +560,7 @@ class TextChatClient:
         temperature: float = 1.0,
         max_output_tokens: int = 8000,
         images: List[Union[bytes, str]] = None,
-        system_prompt: str = None,
-        **kwargs
+        system_prompt: str = None
     ) -> str:
         """
         生成文本（支持图片输入）
@@ -131,21 +576,115 @@ class TextChatClient:
         Returns:
             生成的文本
         """
-        messages = []
+        # 请求体只构建一次，429 重试时只重发请求，不再重复处理图片
+        args = (prompt, model, temperature, max_output_tokens, images, system_prompt)
+        payload, file_ids = self._prepare_payload(*args, use_file_upload=self.supports_file_upload)
+        try:
+            response = self._send(payload, model)
+        except TextAPIError as e:
+            if not self._should_retry_without_files(e, file_ids):
+                raise
+            payload, _ = self._prepare_payload(*args, use_file_upload=False)
+            response = self._send(payload, model)
+            # base64 请求成功说明服务商不接受该引用格式，之后不再上传
+            if e.status_code in _FILE_REF_REJECTED_STATUS:
+                self._disable_file_upload(e.status_code)
+        return self._parse_result(response.content)
+
+    async def agenerate_text(
+        self,
+        prompt: str,
+        model: str = "gemini-3-pro-preview",
+        temperature: float = 1.0,
+        max_output_tokens: int = 8000,
+        images: List[Union[bytes, str]] = None,
+        system_prompt: str = None
+    ) -> str:
+        """
+        异步生成文本，参数与 generate_text 相同
 
-        # 添加系统提示词
-        if system_prompt:
-            messages.append({
-                "role": "system",
-                "content": system_prompt
-            })
+        在 async_session() 作用域内调用时复用作用域的 httpx.AsyncClient（安装 h2 时
+        并发请求走 HTTP/2 多路复用），否则本次调用使用临时客户端，结束后关闭。
+        需要安装 httpx。
+        """
+        async with contextlib.AsyncExitStack() as stack:
+            http = self._async_http.get()
+            if http is None:
+                http = await stack.enter_async_context(self._new_async_http())
+
+            # 构建请求体会压缩/上传图片（阻塞操作），放到线程中执行以免阻塞事件循环
+            args = (prompt, model, temperature, max_output_tokens, images, system_prompt)
+            payload, file_ids = await asyncio.to_thread(
+                self._prepare_payload, *args, use_file_upload=self.supports_file_upload
+            )
+            try:
+                response = await self._asend(http, payload, model)
+            except TextAPIError as e:
+                if not self._should_retry_without_files(e, file_ids):
+                    raise
+                payload, _ = await asyncio.to_thread(self._prepare_payload, *args, use_file_upload=False)
+                response = await self._asend(http, payload, model)
+                if e.status_code in _FILE_REF_REJECTED_STATUS:
+                    self._disable_file_upload(e.status_code)
+            return self._parse_result(response.content)
+
+    @contextlib.asynccontextmanager
+    async def async_session(self):
+        """
+        在作用域内共享一个 httpx.AsyncClient，退出作用域时关闭
+
+        用法：
+            async with client.async_session():
+                await asyncio.gather(client.agenerate_text(a), client.agenerate_text(b))
+        """
+        async with self._new_async_http() as http:
+            token = self._async_http.set(http)
+            try:
+                yield self
+            finally:
+                self._async_http.reset(token)
+
+    def _parse_result(self, content: bytes) -> str:
+        """解析响应并提取生成的文本"""
+        result = _json_loads(content)
+
+        # 提取生成的文本
+        if "choices" in result and len(result["choices"]) > 0:
+            return result["choices"][0]["message"]["content"]
+        else:
+            raise Exception(
+                f"Text API 响应格式异常：未找到生成的文本。\n"
+                f"响应数据: {str(result)[:500]}\n"
+                "可能原因：\n"
+                "1. API返回格式与OpenAI标准不一致\n"
+                "2. 请求被拒绝或过滤\n"
+                "3. 模型输出为空\n"
+                "建议：检查API文档确认响应格式"
+            )
 
+    def _prepare_payload(
+        self,
+        prompt: str,
+        model: str,
+        temperature: float,
+        max_output_tokens: int,
+        images: List[Union[bytes, str]] = None,
+        system_prompt: str = None,
+        use_file_upload: bool = False
+    ) -> Tuple[dict, List[str]]:
+        """构建 chat/completions 请求体，返回 (请求体, 引用的 file_id 列表)"""
         # 构建用户消息内容
-        content = self._build_content_with_images(prompt, images)
-        messages.append({
+        content, file_ids = self._build_content_with_images(prompt, images, use_file_upload)
+        user_message = {
             "role": "user",
             "content": content
-        })
+        }
+
+        # 有系统提示词时放在用户消息之前
+        if system_prompt:
+            messages = [{"role": "system", "content": system_prompt}, user_message]
+        else:
+            messages = [user_message]
 
         payload = {
             "model": model,
@@ -154,27 +693,51 @@ class TextChatClient:
             "max_tokens": max_output_tokens,
             "stream": False
         }
+        return payload, file_ids
 
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
-        response = requests.post(
+    @retry_on_429(max_retries=3, base_delay=2)
+    def _send(self, payload: dict, model: str) -> requests.Response:
+        """发送请求并检查状态码，429 时由装饰器重试"""
+        response = self._session.post(
             self.chat_endpoint,
-            json=payload,
-            headers=headers,
+            data=_json_dumps(payload),
             timeout=300  # 5分钟超时
         )
+        self._check_response(response, model)
+        return response
+
+    def _new_async_http(self) -> "httpx.AsyncClient":
+        """创建 httpx.AsyncClient（由调用方负责关闭）"""
+        if httpx is None:
+            raise RuntimeError(
+                "异步文本生成需要安装 httpx。\n"
+                "解决方案：pip install 'httpx[http2]'"
+            )
+        return httpx.AsyncClient(
+            http2=_HTTP2_AVAILABLE,
+            timeout=300,  # 5分钟超时
+            headers=self._headers
+        )
+
+    @retry_on_429(max_retries=3, base_delay=2)
+    async def _asend(self, http: "httpx.AsyncClient", payload: dict, model: str) -> "httpx.Response":
+        """异步发送请求并检查状态码，429 时由装饰器重试"""
+        response = await http.post(
+            self.chat_endpoint,
+            content=_json_dumps(payload)
+        )
+        self._check_response(response, model)
+        return response
 
+    def _check_response(self, response, model: str):
+        """检查响应状态码（requests 和 httpx 的响应对象均可），失败时抛出详细错误"""
         if response.status_code != 200:
             error_detail = response.text[:500]
             status_code = response.status_code
 
             # 根据状态码给出更详细的错误信息
             if status_code == 401:
-                raise Exception(
+                raise TextAPIError(
                     "❌ API Key 认证失败\n\n"
                     "【可能原因】\n"
                     "1. API Key 无效或已过期\n"
@@ -183,10 +746,11 @@ class TextChatClient:
                     "【解决方案】\n"
                     "1. 在系统设置页面检查 API Key 是否正确\n"
                     "2. 重新获取 API Key\n"
-                    f"\n【请求地址】{self.chat_endpoint}"
+                    f"\n【请求地址】{self.chat_endpoint}",
+                    status_code=status_code
                 )
             elif status_code == 403:
-                raise Exception(
+                raise TextAPIError(
                     "❌ 权限被拒绝\n\n"
                     "【可能原因】\n"
                     "1. API Key 没有访问该模型的权限\n"
@@ -195,10 +759,11 @@ class TextChatClient:
                     "【解决方案】\n"
                     "1. 检查 API 权限配置\n"
                     "2. 尝试使用其他模型\n"
-                    f"\n【原始错误】{error_detail[:200]}"
+                    f"\n【原始错误】{error_detail[:200]}",
+                    status_code=status_code
                 )
             elif status_code == 404:
-                raise Exception(
+                raise TextAPIError(
                     "❌ 模型不存在或 API 端点错误\n\n"
                     "【可能原因】\n"
                     f"1. 模型 '{model}' 不存在或已下线\n"
@@ -206,29 +771,32 @@ class TextChatClient:
                     "【解决方案】\n"
                     "1. 检查模型名称是否正确\n"
                     "2. 检查 Base URL 配置\n"
-                    f"\n【请求地址】{self.chat_endpoint}"
+                    f"\n【请求地址】{self.chat_endpoint}",
+                    status_code=status_code
                 )
             elif status_code == 429:
-                raise Exception(
+                raise RateLimitError(
                     "⏳ API 配额或速率限制\n\n"
                     "【说明】\n"
                     "请求频率过高或配额已用尽。\n\n"
                     "【解决方案】\n"
                     "1. 稍后再试（等待 1-2 分钟）\n"
                     "2. 检查 API 配额使用情况\n"
-                    "3. 考虑升级计划获取更多配额"
+                    "3. 考虑升级计划获取更多配额",
+                    retry_after=_parse_retry_after(response.headers.get('Retry-After'))
                 )
             elif status_code >= 500:
-                raise Exception(
+                raise TextAPIError(
                     f"⚠️ API 服务器错误 ({status_code})\n\n"
                     "【说明】\n"
                     "这是服务端的临时故障，与您的配置无关。\n\n"
                     "【解决方案】\n"
                     "1. 稍等几分钟后重试\n"
-                    "2. 如果持续出现，检查服务商状态页"
+                    "2. 如果持续出现，检查服务商状态页",
+                    status_code=status_code
                 )
             else:
-                raise Exception(
+                raise TextAPIError(
                     f"❌ API 请求失败 (状态码: {status_code})\n\n"
                     f"【原始错误】\n{error_detail}\n\n"
                     f"【请求地址】{self.chat_endpoint}\n"
@@ -236,36 +804,33 @@ class TextChatClient:
                     "【通用解决方案】\n"
                     "1. 检查 API Key 是否正确\n"
                     "2. 检查 Base URL 配置\n"
-                    "3. 检查模型名称是否正确"
+                    "3. 检查模型名称是否正确",
+                    status_code=status_code
                 )
 
-        result = response.json()
 
-        # 提取生成的文本
-        if "choices" in result and len(result["choices"]) > 0:
-            return result["choices"][0]["message"]["content"]
-        else:
-            raise Exception(
-                f"Text API 响应格式异常：未找到生成的文本。\n"
-                f"响应数据: {str(result)[:500]}\n"
-                "可能原因：\n"
-                "1. API返回格式与OpenAI标准不一致\n"
-                "2. 请求被拒绝或过滤\n"
-                "3. 模型输出为空\n"
-                "建议：检查API文档确认响应格式"
-            )
+# 客户端实例缓存：(type, api_key, base_url, endpoint_type, 文件上传配置) -> 客户端，LRU 淘汰
+_CLIENT_CACHE_MAX = 16
+_client_instances: "OrderedDict[tuple, object]" = OrderedDict()
+_client_instances_lock = threading.Lock()
 
 
 def get_text_chat_client(provider_config: dict):
     """
     获取 Text Chat 客户端实例（根据 type 返回对应客户端）
 
+    相同服务商配置复用同一个客户端，以便复用其底层连接池
+
     Args:
         provider_config: 服务商配置字典
             - type: 'google_gemini' 或 'openai_compatible'
             - api_key: API密钥
             - base_url: API基础URL（可选）
             - endpoint_type: 自定义端点路径（可选）
+            - supports_file_upload: 是否通过文件上传接口发送图片（可选，默认 False）
+            - file_upload_endpoint: 文件上传端点路径（可选，默认 /v1/files）
+            - file_content_part: 引用已上传文件的 content 模板，{file_id} 会被替换
+              （开启文件上传时必填，格式须为服务商 chat 接口实际接受的格式）
 
     Returns:
         GenAIClient 或 TextChatClient
@@ -274,9 +839,43 @@ def get_text_chat_client(provider_config: dict):
     api_key = provider_config.get('api_key')
     base_url = provider_config.get('base_url')
     endpoint_type = provider_config.get('endpoint_type')
+    supports_file_upload = bool(provider_config.get('supports_file_upload', False))
+    file_upload_endpoint = provider_config.get('file_upload_endpoint')
+    file_content_part = provider_config.get('file_content_part')
+
+    cache_key = (
+        provider_type, api_key, base_url, endpoint_type,
+        supports_file_upload, file_upload_endpoint, repr(file_content_part)
+    )
+    with _client_instances_lock:
+        client = _client_instances.get(cache_key)
+        if client is not None:
+            _client_instances.move_to_end(cache_key)
+            return client
 
     if provider_type == 'google_gemini':
         from .genai_client import GenAIClient
-        return GenAIClient(api_key=api_key, base_url=base_url)
+        client = GenAIClient(api_key=api_key, base_url=base_url)
     else:
-        return TextChatClient(api_key=api_key, base_url=base_url, endpoint_type=endpoint_type)
+        client = TextChatClient(
+            api_key=api_key,
+            base_url=base_url,
+            endpoint_type=endpoint_type,
+            supports_file_upload=supports_file_upload,
+            file_upload_endpoint=file_upload_endpoint,
+            file_content_part=file_content_part
+        )
+
+    # 淘汰只丢弃缓存中的引用：被淘汰的客户端可能仍被服务实例持有并正在使用
+    with _client_instances_lock:
+        _client_instances[cache_key] = client
+        _client_instances.move_to_end(cache_key)
+        if len(_client_instances) > _CLIENT_CACHE_MAX:
+            _client_instances.popitem(last=False)
+    return client
+
+
+def reset_text_chat_clients():
+    """清空客户端实例缓存（配置更新后调用，旧客户端随引用释放）"""
+    with _client_instances_lock:
+        _client_instances.clear()
@@ -0,0 +1,88 @@
+"""
+配置文件缓存测试
+"""
+import os
+
+import pytest
+
+from backend.config import clear_file_cache, load_cached_file, load_yaml, load_yaml_with_json_cache
+
+
+@pytest.fixture
+def counting_parser():
+    """记录调用次数的 YAML 解析函数"""
+    calls = []
+
+    def parser(f):
+        calls.append(1)
+        return load_yaml(f)
+
+    parser.calls = calls
+    return parser
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    clear_file_cache()
+    yield
+    clear_file_cache()
+
+
+def test_unchanged_file_reuses_parsed_object(tmp_path, counting_parser):
+    """文件未变化时直接返回同一个解析结果"""
+    path = tmp_path / 'config.yaml'
+    path.write_text('active_provider: a\n', encoding='utf-8')
+
+    first = load_cached_file(path, counting_parser)
+    second = load_cached_file(path, counting_parser)
+
+    assert first == {'active_provider': 'a'}
+    assert second is first
+    assert len(counting_parser.calls) == 1
+
+
+def test_touched_file_with_same_content_reuses_parsed_object(tmp_path, counting_parser):
+    """仅 mtime 变化、内容不变时按内容摘要复用解析结果"""
+    path = tmp_path / 'config.yaml'
+    path.write_text('active_provider: a\n', encoding='utf-8')
+    first = load_cached_file(path, counting_parser)
+
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+
+    assert load_cached_file(path, counting_parser) is first
+    assert len(counting_parser.calls) == 1
+
+
+def test_changed_content_is_reparsed(tmp_path, counting_parser):
+    """内容变化后重新解析"""
+    path = tmp_path / 'config.yaml'
+    path.write_text('active_provider: a\n', encoding='utf-8')
+    load_cached_file(path, counting_parser)
+
+    # 文件大小不变，把 mtime 稍微推后，模拟同一秒内的修改
+    path.write_text('active_provider: b\n', encoding='utf-8')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+
+    assert load_cached_file(path, counting_parser) == {'active_provider': 'b'}
+    assert len(counting_parser.calls) == 2
+
+
+def test_yaml_json_cache_skips_lossy_data(tmp_path, monkeypatch):
+    """JSON 无法原样还原的内容（如整数键）不写入旁路缓存"""
+    monkeypatch.setenv('REDBOOK_YAML_CACHE', '1')
+    path = tmp_path / 'config.yaml'
+    cache_path = tmp_path / 'config.yaml.cache.json'
+
+    path.write_text('1: 2\n', encoding='utf-8')
+    with open(path, encoding='utf-8') as f:
+        assert load_yaml_with_json_cache(path, f) == {1: 2}
+    assert not cache_path.exists()
+
+    path.write_text('providers:\n  a: {model: m}\n', encoding='utf-8')
+    with open(path, encoding='utf-8') as f:
+        load_yaml_with_json_cache(path, f)
+    assert cache_path.exists()
+    # 命中缓存时不再读取 YAML
+    assert load_yaml_with_json_cache(path, None) == {'providers': {'a': {'model': 'm'}}}
@@ -0,0 +1,417 @@
+"""
+TextChatClient 429 重试与图片上传测试
+"""
+import pytest
+
+from backend.utils import text_client
+from backend.utils.text_client import RateLimitError, TextChatClient, _parse_retry_after
+
+
+class FakeResponse:
+    """模拟 requests.Response"""
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.text = content.decode('utf-8')
+        self.headers = headers or {}
+
+
+OK_BODY = b'{"choices": [{"message": {"content": "hello"}}]}'
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录重试等待时间，不真正 sleep"""
+    recorded = []
+    monkeypatch.setattr(text_client.time, 'sleep', recorded.append)
+    return recorded
+
+
+@pytest.fixture
+def chat_client():
+    return TextChatClient(api_key='test-key', base_url='https://example.com')
+
+
+def queue_responses(monkeypatch, client, responses):
+    """让 session.post 依次返回给定响应，返回调用记录"""
+    calls = []
+
+    def fake_post(url, **kwargs):
+        calls.append(url)
+        return responses.pop(0)
+
+    monkeypatch.setattr(client._session, 'post', fake_post)
+    return calls
+
+
+def test_429_then_200_retries_only_send(monkeypatch, chat_client, sleeps):
+    """429 后重试只重发请求，不重新构建请求体"""
+    prepare_calls = []
+    original_prepare = chat_client._prepare_payload
+
+    def counting_prepare(*args, **kwargs):
+        prepare_calls.append(1)
+        return original_prepare(*args, **kwargs)
+
+    monkeypatch.setattr(chat_client, '_prepare_payload', counting_prepare)
+    calls = queue_responses(monkeypatch, chat_client, [
+        FakeResponse(429),
+        FakeResponse(200, OK_BODY),
+    ])
+
+    assert chat_client.generate_text('prompt') == 'hello'
+    assert len(calls) == 2
+    assert len(prepare_calls) == 1
+    assert len(sleeps) == 1
+
+
+def test_retry_gives_up_after_three_attempts(monkeypatch, chat_client, sleeps):
+    """连续 429 时最多请求 3 次，然后抛出 RateLimitError"""
+    calls = queue_responses(monkeypatch, chat_client, [FakeResponse(429) for _ in range(5)])
+
+    with pytest.raises(RateLimitError):
+        chat_client.generate_text('prompt')
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_non_429_errors_are_not_retried(monkeypatch, chat_client, sleeps):
+    """其他错误（包括消息里带 rate 字样的）不重试"""
+    calls = queue_responses(monkeypatch, chat_client, [FakeResponse(500, b'generate failed')])
+
+    with pytest.raises(Exception) as exc_info:
+        chat_client.generate_text('prompt')
+    assert not isinstance(exc_info.value, RateLimitError)
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_retry_after_header_is_honored(monkeypatch, chat_client, sleeps):
+    """有 Retry-After 时按其等待"""
+    queue_responses(monkeypatch, chat_client, [
+        FakeResponse(429, headers={'Retry-After': '7'}),
+        FakeResponse(200, OK_BODY),
+    ])
+
+    chat_client.generate_text('prompt')
+    assert sleeps == [7.0]
+
+
+def test_retry_after_header_is_capped(monkeypatch, chat_client, sleeps):
+    """Retry-After 过大时截断到上限"""
+    queue_responses(monkeypatch, chat_client, [
+        FakeResponse(429, headers={'Retry-After': '3600'}),
+        FakeResponse(200, OK_BODY),
+    ])
+
+    chat_client.generate_text('prompt')
+    assert sleeps == [text_client._RETRY_AFTER_MAX]
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('5', 5.0),
+    ('0', 0.0),
+    ('-3', 0.0),
+    ('9999', text_client._RETRY_AFTER_MAX),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', None),
+    ('', None),
+    (None, None),
+])
+def test_parse_retry_after(value, expected):
+    assert _parse_retry_after(value) == expected
+
+
+FILE_PART = {'type': 'image_file', 'image_file': {'file_id': '{file_id}'}}
+
+
+@pytest.fixture
+def upload_client(monkeypatch):
+    """开启文件上传的客户端，图片压缩替换为记录调用的空操作"""
+    client = TextChatClient(
+        api_key='test-key',
+        base_url='https://example.com',
+        supports_file_upload=True,
+        file_content_part=FILE_PART
+    )
+    client.compress_calls = []
+
+    def fake_compress(image_data, max_size_kb=200):
+        client.compress_calls.append(image_data)
+        return b'compressed:' + image_data
+
+    monkeypatch.setattr(text_client, 'compress_image', fake_compress)
+    monkeypatch.setattr(text_client, '_image_url_cache', text_client.OrderedDict())
+    return client
+
+
+def route_requests(monkeypatch, client, upload_responses, chat_responses):
+    """按地址分别返回上传和 chat 响应，返回 (chat 请求体列表, 被删除的文件地址列表)"""
+    payloads, deleted = [], []
+
+    def fake_post(url, **kwargs):
+        if url == client.file_upload_endpoint:
+            return upload_responses.pop(0)
+        payloads.append(text_client._json_loads(kwargs['data']))
+        return chat_responses.pop(0)
+
+    def fake_delete(url, **kwargs):
+        deleted.append(url)
+        return FakeResponse(200)
+
+    monkeypatch.setattr(client._session, 'post', fake_post)
+    monkeypatch.setattr(client._session, 'delete', fake_delete)
+    return payloads, deleted
+
+
+def test_client_without_file_content_part_does_not_upload():
+    """未配置引用格式时不开启文件上传"""
+    client = TextChatClient(api_key='test-key', supports_file_upload=True)
+    assert client.supports_file_upload is False
+
+
+def test_rejected_file_reference_falls_back_to_base64(monkeypatch, upload_client, sleeps):
+    """chat 接口拒绝 file_id 引用时改用 base64 重发并关闭上传，已上传文件只在显式调用时删除"""
+    payloads, deleted = route_requests(
+        monkeypatch, upload_client,
+        [FakeResponse(200, b'{"id": "file-1"}')],
+        [FakeResponse(400, b'invalid content type'), FakeResponse(200, OK_BODY)]
+    )
+
+    assert upload_client.generate_text('prompt', images=[b'img']) == 'hello'
+
+    first, second = (p['messages'][0]['content'][1] for p in payloads)
+    assert first == {'type': 'image_file', 'image_file': {'file_id': 'file-1'}}
+    assert second['type'] == 'image_url'
+    assert second['image_url']['url'].startswith('data:image/png;base64,')
+    assert upload_client.supports_file_upload is False
+    assert deleted == []
+
+    assert upload_client.delete_uploaded_files() == 1
+    assert deleted == [f'{upload_client.file_upload_endpoint}/file-1']
+
+
+def test_failed_upload_reuses_compressed_image(monkeypatch, upload_client, sleeps):
+    """上传失败时直接用已压缩的图片生成 data URL，不重复压缩"""
+    payloads, _ = route_requests(
+        monkeypatch, upload_client,
+        [FakeResponse(500, b'upload failed')],
+        [FakeResponse(200, OK_BODY)]
+    )
+
+    upload_client.generate_text('prompt', images=[b'img'])
+
+    assert upload_client.compress_calls == [b'img']
+    part = payloads[0]['messages'][0]['content'][1]
+    assert part['image_url']['url'] == text_client._encode_data_url(b'compressed:img')
+
+
+def test_expired_file_id_is_dropped_on_404(monkeypatch, upload_client, sleeps):
+    """带 file_id 的请求返回 404 时丢弃该 file_id 并改用 base64 重发，下次重新上传"""
+    payloads, _ = route_requests(
+        monkeypatch, upload_client,
+        [FakeResponse(200, b'{"id": "file-1"}'), FakeResponse(200, b'{"id": "file-2"}')],
+        [FakeResponse(404, b'file not found'), FakeResponse(200, OK_BODY), FakeResponse(200, OK_BODY)]
+    )
+
+    assert upload_client.generate_text('prompt', images=[b'img']) == 'hello'
+    assert payloads[1]['messages'][0]['content'][1]['type'] == 'image_url'
+    assert upload_client.supports_file_upload is True
+    assert list(upload_client._file_ids.values()) == []
+
+    upload_client.generate_text('prompt', images=[b'img'])
+    assert payloads[2]['messages'][0]['content'][1]['image_file'] == {'file_id': 'file-2'}
+
+
+def test_upload_reuses_cached_data_url(monkeypatch, upload_client, sleeps):
+    """data URL 缓存中已有的图片上传时不再压缩"""
+    upload_client._images_to_data_urls([b'img'])
+    route_requests(
+        monkeypatch, upload_client,
+        [FakeResponse(200, b'{"id": "file-1"}')],
+        [FakeResponse(200, OK_BODY)]
+    )
+    uploads = []
+    original_upload = upload_client._upload_image
+    monkeypatch.setattr(upload_client, '_upload_image', lambda data: uploads.append(data) or original_upload(data))
+
+    upload_client.generate_text('prompt', images=[b'img'])
+
+    assert upload_client.compress_calls == [b'img']
+    assert uploads == [b'compressed:img']
+
+
+def test_delete_uploaded_files_stops_at_time_budget(monkeypatch, upload_client):
+    """超出时间预算后停止删除，剩余的 file_id 留待下次调用"""
+    for i in range(3):
+        upload_client._remember_file_id(bytes([i]), f'file-{i}')
+    clock = iter([0.0, 0.0, 6.0, 12.0])
+    monkeypatch.setattr(text_client.time, 'monotonic', lambda: next(clock))
+    _, deleted = route_requests(monkeypatch, upload_client, [], [])
+
+    assert upload_client.delete_uploaded_files(time_budget=10.0) == 2
+    assert len(deleted) == 2
+    assert upload_client._unused_file_ids == ['file-2']
+
+
+httpx = text_client.httpx
+requires_httpx = pytest.mark.skipif(httpx is None, reason='需要安装 httpx')
+
+
+@pytest.fixture
+def async_sleeps(monkeypatch):
+    """记录异步重试等待时间，不真正 sleep"""
+    recorded = []
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+
+    monkeypatch.setattr(text_client.asyncio, 'sleep', fake_sleep)
+    return recorded
+
+
+def mock_async_http(monkeypatch, client, responses):
+    """让异步请求依次返回给定的 (状态码, 响应体)，返回 (请求体列表, 创建的 httpx 客户端列表)"""
+    payloads, created = [], []
+
+    def handler(request):
+        payloads.append(text_client._json_loads(request.content))
+        status_code, body = responses.pop(0)
+        return httpx.Response(status_code, content=body)
+
+    def new_async_http():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(handler), headers=client._headers)
+        created.append(http)
+        return http
+
+    monkeypatch.setattr(client, '_new_async_http', new_async_http)
+    return payloads, created
+
+
+@requires_httpx
+def test_async_429_then_200_retries_with_asyncio_sleep(monkeypatch, chat_client, async_sleeps):
+    """异步接口同样在 429 后重试，等待使用 asyncio.sleep"""
+    payloads, _ = mock_async_http(monkeypatch, chat_client, [(429, b''), (200, OK_BODY)])
+
+    assert text_client.asyncio.run(chat_client.agenerate_text('prompt')) == 'hello'
+    assert len(payloads) == 2
+    assert len(async_sleeps) == 1
+
+
+@requires_httpx
+def test_async_payload_is_built_off_the_event_loop(monkeypatch, chat_client):
+    """请求体在线程中构建，不阻塞事件循环"""
+    threads = []
+    original_prepare = chat_client._prepare_payload
+
+    def recording_prepare(*args, **kwargs):
+        threads.append(text_client.threading.current_thread())
+        return original_prepare(*args, **kwargs)
+
+    monkeypatch.setattr(chat_client, '_prepare_payload', recording_prepare)
+    mock_async_http(monkeypatch, chat_client, [(200, OK_BODY)])
+
+    text_client.asyncio.run(chat_client.agenerate_text('prompt'))
+    assert threads and threads[0] is not text_client.threading.main_thread()
+
+
+@requires_httpx
+def test_async_rejected_file_reference_falls_back_to_base64(monkeypatch, upload_client):
+    """异步接口被拒绝 file_id 引用时同样改用 base64 重发"""
+    route_requests(monkeypatch, upload_client, [FakeResponse(200, b'{"id": "file-1"}')], [])
+    payloads, _ = mock_async_http(monkeypatch, upload_client, [(400, b'bad'), (200, OK_BODY)])
+
+    result = text_client.asyncio.run(upload_client.agenerate_text('prompt', images=[b'img']))
+
+    assert result == 'hello'
+    first, second = (p['messages'][0]['content'][1] for p in payloads)
+    assert first['image_file'] == {'file_id': 'file-1'}
+    assert second['type'] == 'image_url'
+    assert upload_client.supports_file_upload is False
+
+
+@requires_httpx
+def test_async_client_is_closed_after_each_call(monkeypatch, chat_client):
+    """不在 async_session 内时每次调用使用临时客户端，结束后关闭，不保留任何引用"""
+    _, created = mock_async_http(monkeypatch, chat_client, [(200, OK_BODY)] * 3)
+
+    for _ in range(3):
+        text_client.asyncio.run(chat_client.agenerate_text('prompt'))
+
+    assert len(created) == 3
+    assert all(http.is_closed for http in created)
+    assert chat_client._async_http.get() is None
+
+
+@requires_httpx
+def test_async_session_shares_one_client(monkeypatch, chat_client):
+    """async_session 作用域内的并发调用共用同一个客户端，退出作用域时关闭"""
+    _, created = mock_async_http(monkeypatch, chat_client, [(200, OK_BODY)] * 2)
+
+    async def run():
+        async with chat_client.async_session():
+            results = await text_client.asyncio.gather(
+                chat_client.agenerate_text('a'), chat_client.agenerate_text('b')
+            )
+            assert not created[0].is_closed
+        return results
+
+    assert text_client.asyncio.run(run()) == ['hello', 'hello']
+    assert len(created) == 1
+    assert created[0].is_closed
+
+
+class BrokenPool:
+    """map 时抛出 BrokenProcessPool 的进程池"""
+
+    def __init__(self):
+        self.shutdown_calls = []
+
+    def map(self, fn, items):
+        raise text_client.BrokenProcessPool('worker died')
+
+    def shutdown(self, **kwargs):
+        self.shutdown_calls.append(kwargs)
+
+
+@pytest.fixture
+def pool_env(monkeypatch):
+    """开启进程池并假设有 2 个 CPU，图片编码替换为简单函数"""
+    monkeypatch.setenv('REDBOOK_IMAGE_POOL', '1')
+    monkeypatch.setattr(text_client, '_image_pool_workers', lambda: 2)
+    monkeypatch.setattr(text_client, '_compress_and_encode', lambda img: img.decode())
+    monkeypatch.setattr(text_client, '_image_pool', None)
+
+
+def test_image_pool_is_opt_in(monkeypatch, pool_env):
+    """未开启或只有 1 个 CPU 时不使用进程池"""
+    def fail():
+        raise AssertionError('不应创建进程池')
+
+    monkeypatch.setattr(text_client, '_get_image_pool', fail)
+
+    monkeypatch.setattr(text_client, '_image_pool_workers', lambda: 1)
+    assert text_client._compress_and_encode_many([b'a', b'b']) == ['a', 'b']
+
+    monkeypatch.delenv('REDBOOK_IMAGE_POOL')
+    monkeypatch.setattr(text_client, '_image_pool_workers', lambda: 4)
+    assert text_client._compress_and_encode_many([b'a', b'b']) == ['a', 'b']
+
+
+def test_broken_pool_is_discarded_and_falls_back(monkeypatch, pool_env):
+    """进程池损坏时逐张处理，并丢弃该进程池以便下次重建"""
+    pool = BrokenPool()
+    monkeypatch.setattr(text_client, '_image_pool', pool)
+
+    assert text_client._compress_and_encode_many([b'a', b'b']) == ['a', 'b']
+    assert text_client._image_pool is None
+    assert pool.shutdown_calls == [{'wait': False, 'cancel_futures': True}]
+
+
+def test_unavailable_pool_falls_back(monkeypatch, pool_env):
+    """无法创建子进程时逐张处理"""
+    def no_pool():
+        raise OSError('cannot fork')
+
+    monkeypatch.setattr(text_client, '_get_image_pool', no_pool)
+    assert text_client._compress_and_encode_many([b'a', b'b']) == ['a', 'b']